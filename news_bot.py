@@ -1,35 +1,59 @@
 #!/usr/bin/env python3
 import os
-import json
+import re
 import time
 import logging
 import hashlib
+import functools
 from datetime import datetime
+from urllib.parse import urlsplit
 import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
+import aiohttp
 import feedparser
-import requests
-from bs4 import BeautifulSoup
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # без selectolax разбираем через BeautifulSoup
+    HTMLParser = None
+    from bs4 import BeautifulSoup
 
 from sumy.parsers.plaintext import PlaintextParser
 from sumy.nlp.tokenizers import Tokenizer
-from sumy.summarizers.lex_rank import LexRankSummarizer
+from sumy.summarizers.text_rank import TextRankSummarizer
+from sumy.nlp.stemmers import Stemmer
 
 from telegram import Bot
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
 import pymorphy3
 import nltk
 
 # ----------------- NLTK: скачиваем токенизаторы -----------------
 nltk.download("punkt")
 nltk.download("punkt_tab")
+nltk.download("stopwords")
 
 # ----------------- Настройки -----------------
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
-KEYWORDS = os.environ.get("KEYWORDS", "финансовая, платформа, банки").split(",")
+KEYWORDS = [k.strip() for k in os.environ.get("KEYWORDS", "финансовая, платформа, банки").split(",") if k.strip()]
 SOURCES_FILE = "sources.txt"
-PROCESSED_FILE = "processed.json"
+PROCESSED_FILE = "processed.txt"
+PROCESSED_LIMIT = 4000  # сколько последних uid хранить (на материал — uid записи и uid ссылки)
+ARTICLE_CONCURRENCY = 8  # одновременных загрузок статей
+SEND_CONCURRENCY = 4  # одновременных запросов к Bot API
+SEND_INTERVAL = 1.0  # секунды между отправками: в один чат Telegram пускает ~1 сообщение/с
+SEND_RETRIES = 3
+USER_AGENT = "news-watch-bot/1.0"
+HTTP_POOL_SIZE = 32  # keep-alive соединений на весь прогон
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.3  # секунды, удваивается с каждой попыткой
+SNIPPET_MIN_CHARS = 500  # анонс длиннее — статью не скачиваем, если заголовок уже совпал
+ARTICLE_MAX_BYTES = 256 * 1024  # дальше начала страницы текст статьи всё равно обрезается
 
 DEFAULT_RSS = [
     "https://www.garant.ru/rss/news.rss",
@@ -41,8 +65,15 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("news-watch")
 
 # ----------------- Инициализация -----------------
-bot = Bot(token=TELEGRAM_TOKEN)
+bot = Bot(token=TELEGRAM_TOKEN, request=HTTPXRequest(connection_pool_size=SEND_CONCURRENCY))
 morph = pymorphy3.MorphAnalyzer()
+try:
+    import dawg  # noqa: F401 -- C-реализация словарей; без неё pymorphy3 работает на чистом Python
+except ImportError:
+    logger.warning("DAWG C extension not found, pymorphy3 uses slow pure-Python dawg; install pymorphy3[fast]")
+tokenizer = Tokenizer("russian")
+summarizer = TextRankSummarizer(Stemmer("russian"))
+summarizer.stop_words = frozenset(nltk.corpus.stopwords.words("russian"))
 
 # ----------------- Функции -----------------
 def load_sources():
@@ -55,25 +86,82 @@ def load_sources():
 def load_state():
     if os.path.exists(PROCESSED_FILE):
         with open(PROCESSED_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"processed": []}
+            return f.read().splitlines()
+    return []
+
+def save_state(processed, new_ids):
+    # uid по одному в строке, от старых к новым; файл переписывается только при обрезке до лимита
+    if not new_ids:
+        return
+    if len(processed) + len(new_ids) > PROCESSED_LIMIT:
+        tmp = PROCESSED_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(uid + "\n" for uid in (processed + new_ids)[-PROCESSED_LIMIT:]))
+        os.replace(tmp, PROCESSED_FILE)
+    else:
+        with open(PROCESSED_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(uid + "\n" for uid in new_ids))
 
-def save_state(state):
-    with open(PROCESSED_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+def uid_text(s: str):
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=16).hexdigest()
 
 def md5_text(s: str):
+    # старый формат uid — нужен, пока в processed остаются записи до перехода на BLAKE2b
     return hashlib.md5(s.encode("utf-8")).hexdigest()
 
-def summarize_text(text: str, sentence_count=3):
-    parser = PlaintextParser.from_string(text, Tokenizer("russian"))
-    summarizer = LexRankSummarizer()
+def normalize_link(link):
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}?{parts.query}" if host else ""
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def summarize_text(text: str, sentence_count=None):
+    # Грубое деление на предложения: короткий текст возвращаем, не строя граф для TextRank
+    sents = SENTENCE_RE.split(text.strip())
+    if sentence_count is None:
+        sentence_count = max(2, int(len(sents) * 0.15))
+    if len(sents) <= sentence_count:
+        return " ".join(sents)
+    parser = PlaintextParser.from_string(text, tokenizer)
+    if len(parser.document.sentences) <= sentence_count:
+        return text
     summary = summarizer(parser.document, sentence_count)
     return " ".join([str(s) for s in summary])
 
-def fetch_rss(url):
+def make_session():
+    # Одна сессия на прогон: соединения и DNS переиспользуются между RSS и статьями одного хоста
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=15),
+    )
+
+async def http_get(session, url, max_bytes=None):
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            async with session.get(url) as r:
+                if max_bytes is None:
+                    data = await r.read()
+                else:
+                    buf = bytearray()
+                    async for chunk in r.content.iter_chunked(16384):
+                        buf += chunk
+                        if len(buf) >= max_bytes:
+                            break
+                    data = bytes(buf)
+                return data, r.headers.get("Content-Type", ""), r.charset
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == HTTP_RETRIES:
+                raise
+            await asyncio.sleep(HTTP_BACKOFF * 2 ** attempt)
+
+async def fetch_rss(session, url):
+    logger.info("Fetching: %s", url)
     try:
-        feed = feedparser.parse(url)
+        data, content_type, _ = await http_get(session, url)
+        # feedparser разбирает уже скачанные байты сам, без своего блокирующего urllib
+        feed = feedparser.parse(data, response_headers={"content-type": content_type})
         entries = []
         for e in feed.entries:
             title = e.get("title", "")
@@ -86,36 +174,46 @@ def fetch_rss(url):
         logger.exception("RSS fetch failed for %s: %s", url, ex)
         return []
 
-def fetch_plain_article_text(url, max_chars=4000):
+def html_to_text(html):
+    if HTMLParser is None:
+        soup = BeautifulSoup(html, "lxml")
+        text = "\n".join(p.get_text().strip() for p in soup.find_all("p"))
+        return text or soup.get_text()
+    tree = HTMLParser(html)
+    text = "\n".join(p.text().strip() for p in tree.css("p"))
+    if not text:
+        node = tree.body or tree.root
+        text = node.text() if node is not None else ""
+    return text
+
+async def fetch_plain_article_text(session, sem, url, max_chars=4000):
     try:
-        r = requests.get(url, timeout=15, headers={"User-Agent": "news-watch-bot/1.0"})
-        r.encoding = r.apparent_encoding
-        soup = BeautifulSoup(r.text, "lxml")
-        paragraphs = soup.find_all("p")
-        text = "\n".join(p.get_text().strip() for p in paragraphs)
-        if not text:
-            text = soup.get_text()
-        return text[:max_chars]
+        async with sem:
+            raw, _, charset = await http_get(session, url, max_bytes=ARTICLE_MAX_BYTES)
+        # без charset в заголовках кодировку определяет сам парсер (по meta и содержимому)
+        html = raw.decode(charset, errors="replace") if charset else raw
+        return html_to_text(html)[:max_chars]
     except Exception as ex:
         logger.exception("Article fetch failed %s", url)
         return ""
 
+@functools.lru_cache(maxsize=100_000)
+def _lemma(word):
+    p = morph.parse(word)
+    return p[0].normal_form if p else word
+
+# Слова (в т.ч. через дефис) без прилипшей пунктуации: «банки,» -> «банки»
+WORD_RE = re.compile(r"\w+(?:-\w+)*")
+
 def normalize_words(text):
-    words = text.lower().split()
-    lemmas = set()
-    for word in words:
-        p = morph.parse(word)
-        if p:
-            lemmas.add(p[0].normal_form)
-    return lemmas
-
-def matches_keywords(text, keywords):
-    text_lemmas = normalize_words(text)
-    for kw in keywords:
-        kw_lemmas = normalize_words(kw)
-        if text_lemmas & kw_lemmas:
-            return True
-    return False
+    return {_lemma(w) for w in WORD_RE.findall(text.lower())}
+
+# Леммы ключевых слов не меняются за время работы — считаем один раз
+KW_LEMMAS = frozenset().union(*(normalize_words(k) for k in KEYWORDS))
+
+def matches_keywords(text):
+    # Один проход по словам с выходом на первом совпадении, без сборки множества лемм всей статьи
+    return any(_lemma(m.group()) in KW_LEMMAS for m in WORD_RE.finditer(text.lower()))
 
 def make_message(item, summary):
     title = item.get("title", "").strip()
@@ -128,68 +226,158 @@ def make_message(item, summary):
     msg += f"📄 <b>Кратко:</b>\n{summary}\n\n"
     return msg
 
+# Слоты на отправку в один чат: не чаще раза в interval и не раньше конца паузы после 429
+class SendPacer:
+    def __init__(self, interval=SEND_INTERVAL):
+        self.interval = interval
+        self.pause_until = 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        # Лимит общий для чата: пауза задерживает все ожидающие отправки, а не только получившую 429
+        self.pause_until = max(self.pause_until, asyncio.get_running_loop().time() + seconds)
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            # Пауза могла начаться, пока ждали слот, — сверяемся с ней после каждого сна
+            while (delay := max(self._next_slot, self.pause_until) - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = loop.time() + self.interval
+
+async def send_message(sem, pacer, uid, message):
+    async with sem:
+        for attempt in range(SEND_RETRIES + 1):
+            await pacer.wait()
+            try:
+                await bot.send_message(
+                    chat_id=TELEGRAM_CHAT_ID,
+                    text=message,
+                    parse_mode=ParseMode.HTML,
+                    disable_web_page_preview=False
+                )
+                logger.info("Sent: %s", uid)
+                return True
+            except RetryAfter as ex:
+                if attempt == SEND_RETRIES:
+                    logger.error("Giving up on %s after %d retries", uid, SEND_RETRIES)
+                    return False
+                logger.warning("Rate limited, retry %s in %s s", uid, ex.retry_after)
+                pacer.pause(ex.retry_after)
+            except (BadRequest, Forbidden) as ex:
+                # Повтор не поможет (разметка, длина, доступ к чату) — иначе статья уходила бы в каждый прогон
+                logger.error("Telegram rejected %s, marking as processed: %s", uid, ex)
+                return True
+            except (NetworkError, TimedOut) as ex:
+                logger.warning("Send failed for %s, will retry next run: %s", uid, ex)
+                return False
+            except Exception as ex:
+                logger.exception("Failed to send message: %s", ex)
+                return True
+
 # ----------------- Основная логика -----------------
 async def main():
     if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
         logger.error("TELEGRAM_TOKEN or TELEGRAM_CHAT_ID not set.")
         return
 
-    keywords = KEYWORDS
-    logger.info("Keywords: %s", keywords)
+    logger.info("Keywords: %s", KEYWORDS)
     sources = load_sources()
     logger.info("Sources count: %d", len(sources))
 
     state = load_state()
-    processed = set(state.get("processed", []))
+    processed = set(state)
     new_processed = set()
 
     to_notify = []
 
-    for src in sources:
-        logger.info("Fetching: %s", src)
-        entries = fetch_rss(src) if src.startswith("http") else []
+    # ----------------- Параллельная загрузка RSS и статей -----------------
+    async with make_session() as session:
+        feeds = await asyncio.gather(*(fetch_rss(session, src) for src in sources if src.startswith("http")))
+
+        groups = {}
+        for entries in feeds:
+            for e in entries:
+                title = e.get("title", "") or ""
+                link = e.get("link", "") or ""
+                key = (title + link)[:500]
+                uid = uid_text(key)
+                if uid in processed:
+                    continue
+                if md5_text(key) in processed:
+                    new_processed.add(uid)
+                    continue
+                # Один и тот же материал часто приходит из нескольких лент, в т.ч. в разных прогонах
+                # и под другим заголовком, — помним и сам нормализованный адрес
+                norm_link = normalize_link(link)
+                link_uid = uid_text(norm_link) if norm_link else None
+                if link_uid in processed:
+                    continue
+                uids = groups.setdefault(norm_link or uid, ([], e))[0]
+                uids.append(uid)
+                if link_uid and link_uid not in uids:
+                    uids.append(link_uid)
 
-        for e in entries:
+        matched = []
+        to_fetch = []
+        for uids, e in groups.values():
             title = e.get("title", "") or ""
-            link = e.get("link", "") or ""
             snippet = e.get("summary", "") or ""
-            uid = md5_text((title + link)[:500])
-            if uid in processed:
-                continue
-
-            check_text = (title + " " + snippet).lower()
-            if not matches_keywords(check_text, keywords):
-                article_text = fetch_plain_article_text(link)
-                if not matches_keywords(article_text, keywords):
+
+            if matches_keywords(title + " " + snippet):
+                snippet_text = html_to_text(snippet)
+                if len(snippet_text) > SNIPPET_MIN_CHARS:
+                    matched.append((uids, e, snippet_text))
                     continue
+                to_fetch.append((uids, e, True))
             else:
-                article_text = fetch_plain_article_text(link)
+                to_fetch.append((uids, e, False))
+
+        sem = asyncio.Semaphore(ARTICLE_CONCURRENCY)
+        texts = await asyncio.gather(
+            *(fetch_plain_article_text(session, sem, e.get("link", "") or "") for _, e, _ in to_fetch)
+        )
+
+    for (uids, e, title_matched), article_text in zip(to_fetch, texts):
+        if title_matched or matches_keywords(article_text):
+            matched.append((uids, e, article_text))
+
+    # ----------------- Краткое содержание на всех ядрах -----------------
+    article_texts = [text for _, _, text in matched if text]
+    summaries = {}
+    if article_texts:
+        loop = asyncio.get_running_loop()
+        # Воркеры рассчитаны на fork: под spawn/forkserver каждый заново импортировал бы модуль —
+        # с nltk.download, Bot(...) и MorphAnalyzer(). Из потоков к этому моменту остаются только
+        # простаивающие потоки резолвера aiohttp, и на время расчёта цикл больше ничего не ждёт.
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork")) as pool:
+            results = await asyncio.gather(*(loop.run_in_executor(pool, summarize_text, t) for t in article_texts))
+        summaries = dict(zip(article_texts, results))
 
-            summary = summarize_text(article_text, sentence_count=3) if article_text else (snippet[:300] + "...")
+    for uids, e, article_text in matched:
+        snippet = e.get("summary", "") or ""
+        summary = summaries[article_text] if article_text else (snippet[:300] + "...")
 
-            msg = make_message(e, summary)
-            to_notify.append((uid, msg))
-            new_processed.add(uid)
-            await asyncio.sleep(0.5)
+        msg = make_message(e, summary)
+        to_notify.append((uids, msg))
 
     # ----------------- Отправка сообщений асинхронно -----------------
-    for uid, message in to_notify:
-        try:
-            await bot.send_message(
-                chat_id=TELEGRAM_CHAT_ID,
-                text=message,
-                parse_mode=ParseMode.HTML,
-                disable_web_page_preview=False
-            )
-            logger.info("Sent: %s", uid)
-            await asyncio.sleep(1)
-        except Exception as ex:
-            logger.exception("Failed to send message: %s", ex)
-
-    combined = list(processed.union(new_processed))
-    state["processed"] = combined[-2000:]
-    save_state(state)
-    logger.info("Run finished. New items: %d", len(new_processed))
+    done = []
+    if to_notify:
+        # initialize/shutdown один раз: все отправки идут через общий пул HTTPX
+        async with bot:
+            sem = asyncio.Semaphore(SEND_CONCURRENCY)
+            pacer = SendPacer()
+            done = await asyncio.gather(*(send_message(sem, pacer, uids[0], message) for uids, message in to_notify))
+
+    # Не помечаем только сорвавшиеся из-за временных сбоев — они попадут в следующий прогон
+    for (uids, _), ok in zip(to_notify, done):
+        if ok:
+            new_processed.update(uids)
+
+    save_state(state, list(new_processed))
+    logger.info("Run finished. New items: %d", sum(done))
 
 
 if __name__ == "__main__":
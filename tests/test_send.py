@@ -0,0 +1,76 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("TELEGRAM_TOKEN", "123:test")
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+import news_bot
+
+
+class FakeBot:
+    def __init__(self, rate_limited_calls=(), error=None):
+        self.calls = []
+        self.rate_limited_calls = set(rate_limited_calls)
+        self.error = error
+
+    async def send_message(self, **kwargs):
+        self.calls.append(asyncio.get_running_loop().time())
+        if len(self.calls) in self.rate_limited_calls:
+            raise RetryAfter(1)
+        if self.error is not None:
+            raise self.error
+
+
+class SendPacingTest(unittest.IsolatedAsyncioTestCase):
+    async def send_all(self, fake, count, interval=0.05):
+        pacer = news_bot.SendPacer(interval=interval)
+        sem = asyncio.Semaphore(news_bot.SEND_CONCURRENCY)
+        with mock.patch.object(news_bot, "bot", fake):
+            return await asyncio.gather(*(news_bot.send_message(sem, pacer, str(i), "msg") for i in range(count)))
+
+    async def test_sends_are_spaced_by_interval(self):
+        fake = FakeBot()
+        sent = await self.send_all(fake, 4)
+        self.assertEqual(sent, [True] * 4)
+        gaps = [b - a for a, b in zip(fake.calls, fake.calls[1:])]
+        self.assertTrue(all(gap >= 0.045 for gap in gaps), gaps)
+
+    async def test_rate_limit_pauses_every_pending_send(self):
+        fake = FakeBot(rate_limited_calls={2})
+        sent = await self.send_all(fake, 5)
+        self.assertEqual(sent, [True] * 5)
+        self.assertEqual(len(fake.calls), 6)
+        limited_at = fake.calls[1]
+        # Ни одна отправка не уходит внутри окна, которое назвал Telegram
+        self.assertTrue(all(t >= limited_at + 0.99 for t in fake.calls[2:]), fake.calls)
+
+    async def test_last_retry_is_attempted_after_last_pause(self):
+        fake = FakeBot(rate_limited_calls={1, 2})
+        with mock.patch.object(news_bot, "SEND_RETRIES", 1):
+            sent = await self.send_all(fake, 1)
+        self.assertEqual(sent, [False])
+        self.assertEqual(len(fake.calls), 2)
+
+
+
+class SendErrorsTest(unittest.IsolatedAsyncioTestCase):
+    async def send_one(self, error):
+        fake = FakeBot(error=error)
+        with mock.patch.object(news_bot, "bot", fake):
+            done = await news_bot.send_message(asyncio.Semaphore(1), news_bot.SendPacer(interval=0), "uid", "msg")
+        self.assertEqual(len(fake.calls), 1)
+        return done
+
+    async def test_rejected_message_is_marked_processed(self):
+        self.assertTrue(await self.send_one(BadRequest("Can't parse entities")))
+
+    async def test_transient_failures_are_left_for_next_run(self):
+        self.assertFalse(await self.send_one(NetworkError("connection reset")))
+        self.assertFalse(await self.send_one(TimedOut()))
+
+
+if __name__ == "__main__":
+    unittest.main()